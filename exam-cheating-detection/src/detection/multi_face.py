@@ -1,42 +1,33 @@
-import cv2
-import numpy as np
-
 class MultiFaceDetector:
     def __init__(self, config):
-        # Use OpenCV's Haar Cascade for face detection
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        # Face counting is done by UnifiedFaceDetector's shared FaceMesh graph
+        # (max_num_faces > 1); this class only applies the temporal alert logic
         self.threshold = config['detection']['multi_face']['alert_threshold']
-        self.consecutive_frames = 0
+        self.consecutive_frames = 0  # counted in inference frames
+        self.multiple_faces = False
         self.alert_logger = None
 
     def set_alert_logger(self, alert_logger):
         self.alert_logger = alert_logger
 
-    def detect_multiple_faces(self, frame):
-        # Convert to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # Detect faces
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
-        
-        if len(faces) > 1:
-            # Count faces with reasonable confidence (all detected faces from Haar Cascade)
-            high_conf_faces = len(faces)
+    def detect_multiple_faces(self, face_count, fresh=True):
+        """Takes the number of faces found in the current frame
+        (DetectionState.face_count, as returned by UnifiedFaceDetector.process_frame()).
+        fresh=False (DetectionState.fresh) means the count was reused from a skipped frame;
+        it doesn't advance the streak and the last verdict is returned"""
+        if not fresh:
+            return self.multiple_faces
             
-            if high_conf_faces >= 2:
-                self.consecutive_frames += 1
-                if self.consecutive_frames >= self.threshold and self.alert_logger:
-                    self.alert_logger.log_alert(
-                        "MULTIPLE_FACES",
-                        f"Detected {high_conf_faces} faces for {self.consecutive_frames} frames"
-                    )
-                    return True
+        self.multiple_faces = False
+        if face_count > 1:
+            self.consecutive_frames += 1
+            if self.consecutive_frames >= self.threshold and self.alert_logger:
+                self.alert_logger.log_alert(
+                    "MULTIPLE_FACES",
+                    f"Detected {face_count} faces for {self.consecutive_frames} frames"
+                )
+                self.multiple_faces = True
         else:
             self.consecutive_frames = 0
             
-        return False
\ No newline at end of file
+        return self.multiple_faces
\ No newline at end of file
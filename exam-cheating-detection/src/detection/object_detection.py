@@ -73,8 +73,9 @@
 
 import cv2
 import torch
+import time
+from collections import deque
 from ultralytics import YOLO
-from datetime import datetime
 
 class ObjectDetector:
     def __init__(self, config):
@@ -90,8 +91,17 @@ class ObjectDetector:
         self.alert_logger = None
         self.detection_interval = self.config['detection_interval']
         self.frame_count = 0
+        self.last_detected = False
+        # Frames are accumulated and sent to YOLO as one batch; each entry keeps
+        # its own frame copy and timestamp so results can be reported per frame
+        self.batch_size = self.config.get('batch_size', 1)
+        self.pending_frames = deque(maxlen=self.batch_size)
+        # Boxes behind last_detected as (found, origin); redrawn on the live view
+        # by draw_last_detections so the overlay doesn't blink
+        self.last_boxes = None
+        self.infer_w = 320
         self._initialize_model()
-        self.last_detection_time = datetime.now()
+        self.last_detection_time = time.monotonic()
 
     def _initialize_model(self):
         """Initialize optimized YOLO model"""
@@ -117,60 +127,164 @@ class ObjectDetector:
     def set_alert_logger(self, alert_logger):
         self.alert_logger = alert_logger
 
-    def detect_objects(self, frame, visualize=False):
-        """Optimized object detection with frame skipping"""
-        current_time = datetime.now()
-        time_since_last = (current_time - self.last_detection_time).total_seconds()
+    def _resize(self, image, scale):
+        """Resize image by scale (maintaining aspect ratio)"""
+        h, w = image.shape[:2]
+        return cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))))
+
+    def _infer_batch(self, small_frames):
+        """Run one forward pass over resized frames.
+        Returns, per frame, a list of (label, conf, (x1, y1, x2, y2)) in resized coordinates"""
+        # Ultralytics accepts a list of images and batches them internally.
+        # ROI crops are smaller than infer_w, so shrink imgsz to the largest side
+        # (rounded up to the model stride) instead of letterboxing them up to 320
+        longest = max(max(small.shape[:2]) for small in small_frames)
+        imgsz = min(self.infer_w, -(-longest // 32) * 32)
+        results = self.model(list(small_frames), imgsz=imgsz, verbose=False)  # Disable logging
         
-        # Skip detection if not enough time has passed
-        if time_since_last < (1.0 / self.config['max_fps']):
-            return False
+        detections = []
+        for result in results:
+            found = []
+            for box in result.boxes:
+                cls = int(box.cls)
+                conf = float(box.conf)
+                
+                if cls in self.class_map and conf > self.config['min_confidence']:
+                    label = self.class_map[cls]
+                    found.append((label, conf, tuple(float(v) for v in box.xyxy[0])))
+                    
+                    if self.alert_logger:
+                        self.alert_logger.log_alert(
+                            "FORBIDDEN_OBJECT",
+                            f"Detected {label} with confidence {conf:.2f}"
+                        )
+            detections.append(found)
+        return detections
+
+    def _draw_detections(self, frame, found, origin=(0, 0)):
+        """Draw boxes, scaling coordinates back to original frame size.
+        origin is the top-left of the crop the detections came from (default: whole frame)"""
+        scale = frame.shape[1] / self.infer_w
+        ox, oy = origin
+        for label, conf, (x1, y1, x2, y2) in found:
+            x1, x2 = (int(v * scale) + ox for v in (x1, x2))
+            y1, y2 = (int(v * scale) + oy for v in (y1, y2))
             
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+            cv2.putText(frame, f"{label} {conf:.2f}", (x1, y1-10),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+
+    def _crop_to_roi(self, frame, face_bbox):
+        """Crop to the area around the face where held objects show up:
+        one face-width either side, half a face-height above, two below.
+        Returns (crop, (x, y) origin); the full frame if there is no face"""
+        if face_bbox is None:
+            return frame, (0, 0)
+        h, w = frame.shape[:2]
+        x_min, y_min, x_max, y_max = face_bbox
+        face_w, face_h = x_max - x_min, y_max - y_min
+        x1 = max(0, int((x_min - face_w) * w))
+        x2 = min(w, int((x_max + face_w) * w))
+        y1 = max(0, int((y_min - face_h / 2) * h))
+        y2 = min(h, int((y_max + 2 * face_h) * h))
+        if x2 - x1 < 64 or y2 - y1 < 64:
+            return frame, (0, 0)
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    def _prepare(self, frame, face_bbox=None):
+        """Crop to the ROI and keep a resized copy; the full frame gets annotated/recorded meanwhile.
+        The crop is scaled by the same factor as the full frame (infer_w / frame width),
+        so it is never blown up past the full-frame input size.
+        Returns (small, origin) as expected by _run_batch/_draw_detections"""
+        crop, origin = self._crop_to_roi(frame, face_bbox)
+        return self._resize(crop, self.infer_w / frame.shape[1]), origin
+
+    def _run_batch(self, entries):
+        """One forward pass over prepared entries; last_detected/last_boxes follow the newest entry.
+        Returns the per-entry detections"""
+        detections = self._infer_batch([small for small, _ in entries])
+        
+        # The newest entry is what stays on screen until the next batch
+        newest, (_, origin) = detections[-1], entries[-1]
+        self.last_detected = bool(newest)
+        self.last_boxes = (newest, origin) if newest else None
+        return detections
+
+    def draw_last_detections(self, frame):
+        """Redraw the boxes behind last_detected (live view only; they may come from an earlier frame)"""
+        if self.last_boxes:
+            found, origin = self.last_boxes
+            self._draw_detections(frame, found, origin)
+
+    def detect_objects_batch(self, frames, visualize=False, face_bboxes=None):
+        """Detect forbidden objects in several frames with a single forward pass.
+        face_bboxes optionally gives one normalized face box per frame to crop to.
+        Returns one bool per frame"""
+        face_bboxes = face_bboxes or [None] * len(frames)
         try:
-            # Resize frame for faster processing (maintaining aspect ratio)
-            orig_h, orig_w = frame.shape[:2]
-            new_w = 320
-            new_h = int(orig_h * (new_w / orig_w))
-            resized_frame = cv2.resize(frame, (new_w, new_h))
+            entries = [self._prepare(frame, bbox) for frame, bbox in zip(frames, face_bboxes)]
+            detections = self._run_batch(entries)
             
-            # Run inference
-            results = self.model(resized_frame, verbose=False)  # Disable logging
-            
-            detected = False
-            for result in results:
-                for box in result.boxes:
-                    cls = int(box.cls)
-                    conf = float(box.conf)
+            if visualize:
+                for frame, found, (_, origin) in zip(frames, detections, entries):
+                    self._draw_detections(frame, found, origin)
                     
-                    if cls in self.class_map and conf > self.config['min_confidence']:
-                        detected = True
-                        label = self.class_map[cls]
-                        
-                        if self.alert_logger:
-                            self.alert_logger.log_alert(
-                                "FORBIDDEN_OBJECT",
-                                f"Detected {label} with confidence {conf:.2f}"
-                            )
-                        
-                        if visualize:
-                            # Scale coordinates back to original frame size
-                            x1, y1, x2, y2 = box.xyxy[0]
-                            x1 = int(x1 * (orig_w / new_w))
-                            y1 = int(y1 * (orig_h / new_h))
-                            x2 = int(x2 * (orig_w / new_w))
-                            y2 = int(y2 * (orig_h / new_h))
-                            
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-                            cv2.putText(frame, f"{label} {conf:.2f}", (x1, y1-10),
-                                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+            return [bool(found) for found in detections]
             
+        except Exception as e:
+            if self.alert_logger:
+                self.alert_logger.log_alert(
+                    "OBJECT_DETECTION_ERROR",
+                    f"Object detection failed: {str(e)}"
+                )
+            return [False] * len(frames)
+
+    def detect_objects(self, frame, visualize=False, face_bbox=None, timestamp=None):
+        """Optimized object detection with frame skipping and batching.
+        Sampled frames are queued, with a copy kept as evidence, until batch_size is reached.
+        Returns (evidence_frame, timestamp) for every queued frame whose own detections were
+        positive once its batch has run, otherwise an empty list. With visualize the boxes are
+        drawn on those evidence frames; draw_last_detections annotates the live view.
+        face_bbox (normalized, from UnifiedFaceDetector) restricts detection to the area around the student"""
+        # Only run inference on every Nth frame
+        self.frame_count += 1
+        if self.frame_count % self.detection_interval != 0:
+            return []
+            
+        current_time = time.monotonic()
+        time_since_last = current_time - self.last_detection_time
+        
+        # Skip detection if not enough time has passed
+        if time_since_last < (1.0 / self.config['max_fps']):
+            return []
+            
+        if timestamp is None:
+            timestamp = time.time()
+        try:
+            # Copy before the caller draws overlays on the frame
+            self.pending_frames.append((self._prepare(frame, face_bbox), frame.copy(), timestamp))
+            if len(self.pending_frames) < self.batch_size:
+                return []
+                
+            # Run inference
+            pending = list(self.pending_frames)
+            self.pending_frames.clear()
+            detections = self._run_batch([entry for entry, _, _ in pending])
             self.last_detection_time = current_time
-            return detected
+            
+            hits = []
+            for found, ((_, origin), evidence, frame_time) in zip(detections, pending):
+                if found:
+                    if visualize:
+                        self._draw_detections(evidence, found, origin)
+                    hits.append((evidence, frame_time))
+            return hits
             
         except Exception as e:
+            self.pending_frames.clear()
             if self.alert_logger:
                 self.alert_logger.log_alert(
                     "OBJECT_DETECTION_ERROR",
                     f"Object detection failed: {str(e)}"
                 )
-            return False
\ No newline at end of file
+            return []
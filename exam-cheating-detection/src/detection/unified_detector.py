@@ -1,25 +1,160 @@
 import cv2
 import mediapipe as mp
 import numpy as np
-from datetime import datetime
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional; fall back to plain Python if it is not installed
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+
+@njit(cache=True, fastmath=True)
+def _iris_position(center_x, left_x, right_x):
+    """Normalized iris position (0.0=left, 1.0=right)"""
+    width = right_x - left_x
+    if width == 0:
+        return 0.5
+    return (center_x - left_x) / width
+
+
+@njit(cache=True, fastmath=True)
+def _compute_metrics(pts, w, h):
+    """
+    Per-frame numeric kernel over the landmark array (see UnifiedFaceDetector._IDX).
+    Returns: (avg_gaze_ratio, mar, ear)
+    """
+    # Gaze: iris x between the out (left) and in (right) corner of each eye
+    gaze_l = _iris_position(pts[0, 0], pts[2, 0], pts[1, 0])
+    gaze_r = _iris_position(pts[3, 0], pts[5, 0], pts[4, 0])
+    avg_gaze_ratio = (gaze_l + gaze_r) / 2.0
+
+    # Mouth Aspect Ratio in pixels: height (13-14) / width (61-291)
+    dx = (pts[6, 0] - pts[7, 0]) * w
+    dy = (pts[6, 1] - pts[7, 1]) * h
+    mouth_height = np.sqrt(dx * dx + dy * dy)
+    dx = (pts[8, 0] - pts[9, 0]) * w
+    dy = (pts[8, 1] - pts[9, 1]) * h
+    mouth_width = np.sqrt(dx * dx + dy * dy)
+    if mouth_width == 0:
+        mouth_width = 1.0
+    mar = mouth_height / mouth_width
+
+    # Eyelid gap (159-145), scaled up
+    dx = pts[10, 0] - pts[11, 0]
+    dy = pts[10, 1] - pts[11, 1]
+    ear = np.sqrt(dx * dx + dy * dy) * 10
+
+    return avg_gaze_ratio, mar, ear
+
+
+# MediaPipe graphs are built once per process and shared by every UnifiedFaceDetector,
+# so re-creating a detector (e.g. per student session) doesn't reload the models.
+# The graphs are stateful (FaceMesh tracking mode, FaceLandmarker VIDEO mode carry
+# face regions from frame to frame) and not thread-safe: a shared graph must only
+# ever see ONE video stream, from one thread. Sessions may replace each other
+# (hot restart), but must not take turns on different streams.
+_MODELS = {}
+_MODELS_LOCK = threading.Lock()
+_last_timestamp_ms = 0
+
+
+def _get_model(key, factory):
+    """Return the shared model for key, building it with factory() on first use"""
+    model = _MODELS.get(key)
+    if model is None:
+        with _MODELS_LOCK:
+            model = _MODELS.get(key)
+            if model is None:
+                model = _MODELS[key] = factory()
+    return model
+
+
+def _next_timestamp_ms():
+    """Strictly increasing timestamp for the shared VIDEO-mode FaceLandmarker"""
+    global _last_timestamp_ms
+    with _MODELS_LOCK:
+        _last_timestamp_ms = max(int(time.monotonic() * 1000), _last_timestamp_ms + 1)
+        return _last_timestamp_ms
+
+
+class DetectionState:
+    """
+    Per-frame detection results. UnifiedFaceDetector keeps a single instance and
+    updates it in place every frame; main() fills in the remaining fields.
+    """
+    __slots__ = ('face_present', 'gaze_direction', 'eye_ratio', 'mouth_moving',
+                 'mouth_open_score', 'face_count', 'face_bbox',
+                 'multiple_faces', 'objects_detected', 'timestamp', 'fresh')
+
+    def __init__(self):
+        self.fresh = False  # True when this frame ran inference (not a skipped frame)
+        self.multiple_faces = False
+        self.objects_detected = False
+        self.timestamp = 0.0  # epoch seconds
+        self.clear_face()
+
+    def clear_face(self):
+        """Reset the face-derived fields (no face in frame)"""
+        self.face_present = False
+        self.gaze_direction = 'Unknown'
+        self.eye_ratio = 0.0
+        self.mouth_moving = False
+        self.mouth_open_score = 0.0
+        self.face_count = 0
+        self.face_bbox = None
+
+    # Keys written to the violation log (same set and order as the old per-frame dict)
+    LOG_FIELDS = ('face_present', 'gaze_direction', 'eye_ratio', 'mouth_moving',
+                  'multiple_faces', 'objects_detected', 'timestamp', 'mouth_open_score')
+
+    def to_dict(self):
+        """Snapshot for logging (the instance itself is reused next frame)"""
+        return {name: getattr(self, name) for name in self.LOG_FIELDS}
+
 
 class UnifiedFaceDetector:
     def __init__(self, config):
         self.config = config
         
-        # Initialize MediaPipe Face Mesh
+        # Prefer the MediaPipe Tasks FaceLandmarker (GPU delegate where available);
+        # fall back to the legacy solutions Face Mesh if the model bundle is missing
+        face_config = config['detection']['face']
+        model_path = face_config.get('landmarker_model', 'models/face_landmarker.task')
+        self.face_landmarker = None
+        self.face_mesh = None
+        
         try:
             from mediapipe import solutions
         except ImportError:
             import mediapipe.python.solutions as solutions
             
-        self.mp_face_mesh = solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            max_num_faces=1,
-            refine_landmarks=True,  # Crucial for iris tracking
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
+        if os.path.exists(model_path):
+            delegate = face_config.get('delegate', 'gpu')
+            self.face_landmarker = _get_model(
+                ('face_landmarker', model_path, delegate),
+                lambda: self._create_landmarker(model_path, delegate)
+            )
+        else:
+            self.mp_face_mesh = solutions.face_mesh
+            self.face_mesh = _get_model(('face_mesh',), lambda: self.mp_face_mesh.FaceMesh(
+                max_num_faces=4,  # Also used for multi-face counting (no second model)
+                refine_landmarks=True,  # Crucial for iris tracking
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.5
+            ))
+        
+        # Cheap BlazeFace gate: while no face is present, the landmark model
+        # only runs once this short-range detector finds a face again
+        self.face_detection = _get_model(('face_detection',), lambda: solutions.face_detection.FaceDetection(
+            model_selection=0,
+            min_detection_confidence=0.5
+        ))
         
         self.alert_logger = None
         
@@ -29,114 +164,202 @@ class UnifiedFaceDetector:
         self.face_disappeared_start = None
         
         self.gaze_direction = "Center"
-        self.last_gaze_change = datetime.now()
+        self.last_gaze_change = time.monotonic()  # seconds
         self.gaze_changes = 0
         
+        # Gaze ratio bucket bounds (0.0=Left-most .. 1.0=Right-most, Center ~0.5)
+        # NARROWER THRESHOLDS for better sensitivity at distance
+        # Mirrored: Right = user looking to their Right (Screen Left), and vice versa
+        self.GAZE_BOUNDS = (0.46, 0.54)
+        self.GAZE_LABELS = ("Right", "Center", "Left")
+        
+        # Run FaceMesh on every Nth frame; in between, reuse the last results
+        self.INFER_EVERY = 2
+        self.frame_counter = 0
+        self._has_results = False
+        
         # EAR/MAR parameters
         # GAP/MAR parameters
         # Mouth Aspect Ratio thresholds
         self.MAR_THRESHOLD = 0.15  # MUCH Lower threshold for subtle talking
-        self.mouth_state_history = []
-        self.MOUTH_HISTORY_LEN = 20 # Longer history to catch slow speech
+        # Longer history to catch slow speech: 20 camera frames, counted in inference frames
+        self.MOUTH_HISTORY_LEN = max(1, 20 // self.INFER_EVERY)
+        self.mouth_state_history = deque(maxlen=self.MOUTH_HISTORY_LEN)
+        self._mouth_activity = 0  # running sum of mouth_state_history
+        
+        # Landmarks used per frame, written into a preallocated (16, 2) scratch array.
+        # Row order: l_iris, l_corner_in, l_corner_out, r_iris, r_corner_in,
+        # r_corner_out, mouth_top, mouth_bottom, mouth_left, mouth_right,
+        # l_lid_top, l_lid_bottom, forehead, chin, l_cheek, r_cheek
+        self._IDX = np.array([473, 362, 263, 468, 133, 33, 13, 14, 61, 291, 159, 145,
+                              10, 152, 234, 454], dtype=np.int32)
+        self._IDX_ROWS = tuple(enumerate(self._IDX.tolist()))  # plain ints for protobuf indexing
+        self._scratch = np.empty((len(self._IDX), 2), dtype=np.float32)
+        
+        # Warm up (JIT-compile) the numeric kernel so the first frame isn't slow
+        self._scratch.fill(0)
+        _compute_metrics(self._scratch, 1.0, 1.0)
+        
+        # Results object reused (mutated in place) every frame
+        self._state = DetectionState()
+        
+        # Inference width: frames are downscaled to this before FaceMesh.
+        # Landmarks come back normalized, so downstream math is unaffected.
+        self.INFER_W = 480
+        
+        # Reusable resize (BGR) and RGB buffers for MediaPipe input
+        # (re-allocated if the camera delivers a different resolution than configured)
+        res_w, res_h = config['video']['resolution']
+        self._small = np.empty(self._infer_shape(res_h, res_w), dtype=np.uint8)
+        self._rgb = np.empty_like(self._small)
         
     def set_alert_logger(self, alert_logger):
         self.alert_logger = alert_logger
 
-    def _get_aspect_ratio(self, p1, p2, p3, p4, p5, p6):
-        """Calculate aspect ratio for eyes or mouth"""
-        # Vertical distances
-        A = np.linalg.norm(np.array(p2) - np.array(p6))
-        B = np.linalg.norm(np.array(p3) - np.array(p5))
-        # Horizontal distance
-        C = np.linalg.norm(np.array(p1) - np.array(p4))
-        if C == 0: return 0
-        return (A + B) / (2.0 * C)
-
-    def _get_iris_position(self, iris_center, eye_corners):
-        """Calculate normalized iris position (0.0=left, 1.0=right)"""
-        center_x = iris_center[0]
-        left_x = eye_corners[0][0]
-        right_x = eye_corners[1][0]
+    def _create_landmarker(self, model_path, delegate):
+        """Build a VIDEO-mode FaceLandmarker, trying the GPU delegate first if requested"""
+        from mediapipe.tasks import python as mp_tasks
+        from mediapipe.tasks.python import vision
         
-        width = right_x - left_x
-        if width == 0: return 0.5
+        def options(delegate):
+            return vision.FaceLandmarkerOptions(
+                base_options=mp_tasks.BaseOptions(model_asset_path=model_path, delegate=delegate),
+                running_mode=vision.RunningMode.VIDEO,
+                num_faces=4,  # Also used for multi-face counting (no second model)
+                min_face_detection_confidence=0.5,
+                min_face_presence_confidence=0.5,
+                min_tracking_confidence=0.5,
+                output_face_blendshapes=False,
+                output_facial_transformation_matrixes=False
+            )
         
-        # Normalized position: 0 (left) to 1 (right)
-        return (center_x - left_x) / width
+        if delegate == 'gpu':
+            try:
+                return vision.FaceLandmarker.create_from_options(options(mp_tasks.BaseOptions.Delegate.GPU))
+            except Exception as e:
+                print(f"[WARN] FaceLandmarker GPU delegate unavailable, using CPU: {str(e)}")
+        return vision.FaceLandmarker.create_from_options(options(mp_tasks.BaseOptions.Delegate.CPU))
+
+    def _detect_faces(self, rgb):
+        """Run the face model; returns one 478-landmark sequence per detected face"""
+        if self.face_landmarker is not None:
+            # VIDEO mode needs strictly increasing timestamps
+            image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
+            return self.face_landmarker.detect_for_video(image, _next_timestamp_ms()).face_landmarks
+            
+        results = self.face_mesh.process(rgb)
+        if not results.multi_face_landmarks:
+            return []
+        return [face.landmark for face in results.multi_face_landmarks]
+
+    def _infer_shape(self, h, w):
+        """Shape of the downscaled RGB frame fed to FaceMesh"""
+        if w <= self.INFER_W:
+            return (h, w, 3)
+        return (int(h * self.INFER_W / w), self.INFER_W, 3)
+
+    def _get_aspect_ratio(self, pts):
+        """Calculate aspect ratio for eyes or mouth from a (6, 2) array p1..p6"""
+        # Vertical distances (p2-p6, p3-p5) and horizontal distance (p1-p4)
+        A, B, C = np.linalg.norm(pts[[1, 2, 0]] - pts[[5, 4, 3]], axis=1)
+        if C == 0: return 0
+        return (A + B) / (2.0 * C)
 
     def process_frame(self, frame):
         """
         Process frame and return all detection results in a single pass.
-        Returns: params dict with face_present, gaze_direction, eye_ratio, mouth_moving
+        Returns: the detector's DetectionState (same instance every call) with face_present,
+        gaze_direction, eye_ratio, mouth_moving, face_count and face_bbox
+        (normalized x1, y1, x2, y2 of the face extremes, or None)
         """
-        results_dict = {
-            'face_present': False,
-            'gaze_direction': 'Unknown',
-            'eye_ratio': 0.0,
-            'mouth_moving': False,
-            'mouth_open_score': 0.0
-        }
+        state = self._state
+        
+        # Frame skipping: reuse cached landmarks-derived results
+        self.frame_counter += 1
+        if self.frame_counter % self.INFER_EVERY != 0 and self._has_results:
+            state.fresh = False
+            return state
+        self._has_results = True
+        state.fresh = True
+        
+        h, w, _ = frame.shape
+        
+        # Downscale before inference; detector cost scales with input pixels
+        infer_shape = self._infer_shape(h, w)
+        if self._rgb.shape != infer_shape:
+            self._small = np.empty(infer_shape, dtype=np.uint8)
+            self._rgb = np.empty_like(self._small)
+        small = frame
+        if infer_shape[1] != w:
+            small = cv2.resize(frame, (infer_shape[1], infer_shape[0]), dst=self._small,
+                               interpolation=cv2.INTER_AREA)
         
         # RGB Conversion for MediaPipe
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.face_mesh.process(rgb_frame)
+        # Single-threaded channel swap into a reused buffer; cv2.cvtColor would
+        # spin up its own threads and compete with MediaPipe's thread pool
+        self._rgb.flags.writeable = True
+        np.copyto(self._rgb, small[:, :, ::-1])
+        # Read-only input lets MediaPipe skip its defensive copy
+        self._rgb.flags.writeable = False
+        if not self.face_present and not self.face_detection.process(self._rgb).detections:
+            faces = []  # Student still away: skip the 478-landmark model
+        else:
+            faces = self._detect_faces(self._rgb)
         
-        current_time = datetime.now()
+        current_time = time.monotonic()
         
-        if not results.multi_face_landmarks:
+        if not faces:
             # Handle Face Disappearance Logic
             if self.face_present:
                 self.face_disappeared_start = current_time
             self.face_present = False
             
-            if self.face_disappeared_start and (current_time - self.face_disappeared_start).total_seconds() > 5:
+            if self.face_disappeared_start is not None and (current_time - self.face_disappeared_start) > 5:
                 if self.alert_logger:
                     self.alert_logger.log_alert("FACE_DISAPPEARED", "Face disappeared for > 5s")
                     # Reset timer to avoid spam
                     self.face_disappeared_start = current_time 
             
-            return results_dict
+            state.clear_face()
+            return state
 
         # Face is present
         self.face_present = True
         self.face_disappeared_start = None
-        results_dict['face_present'] = True
+        state.face_present = True
+        state.face_count = len(faces)
         
-        landmarks = results.multi_face_landmarks[0].landmark
-        h, w, _ = frame.shape
+        landmarks = faces[0]
+        
+        # Copy only the landmarks we need into the scratch buffer (no per-point ndarrays)
+        sel = self._scratch
+        for i, idx in self._IDX_ROWS:
+            lm = landmarks[idx]
+            sel[i, 0] = lm.x
+            sel[i, 1] = lm.y
+        
+        # Face extremes (rows 12-15), used to crop the object detector's input
+        x_min, y_min = sel[12:16].min(axis=0)
+        x_max, y_max = sel[12:16].max(axis=0)
+        state.face_bbox = (float(x_min), float(y_min), float(x_max), float(y_max))
+        
+        # Gaze ratio, MAR and EAR in one compiled call
+        avg_gaze_ratio, mar, ear = _compute_metrics(sel, float(w), float(h))
         
         # ---------------------------------------------------------
         # 1. Gaze Tracking (Using Iris Landmarks)
         # ---------------------------------------------------------
-        # Right Eye (User's Left): 474, 476, 475, 477 (Iris), 33 (Corner1), 133 (Corner2)
-        # Left Eye (User's Right): 469, 471, 470, 472 (Iris), 362 (Corner1), 263 (Corner2)
-        
-        # Get coordinates for Left Eye (User's Right)
-        l_iris = np.array([landmarks[473].x, landmarks[473].y]) # Center of left iris
-        l_corner_in = np.array([landmarks[362].x, landmarks[362].y])
-        l_corner_out = np.array([landmarks[263].x, landmarks[263].y])
-        
-        # Get coordinates for Right Eye (User's Left)
-        r_iris = np.array([landmarks[468].x, landmarks[468].y]) # Center of right iris
-        r_corner_in = np.array([landmarks[133].x, landmarks[133].y])
-        r_corner_out = np.array([landmarks[33].x, landmarks[33].y])
+        # Left Eye (User's Right): rows 0-2 -> 473 (iris center), 362 (in), 263 (out)
+        # Right Eye (User's Left): rows 3-5 -> 468 (iris center), 133 (in), 33 (out)
         
-        # Calculate horizontal ratios
+        # Horizontal ratios come from _compute_metrics
         # Note: Mirror effect - if iris is closer to "out" corner, they are looking the other way
-        gaze_ratio_l = self._get_iris_position(l_iris, [l_corner_out, l_corner_in])
-        gaze_ratio_r = self._get_iris_position(r_iris, [r_corner_out, r_corner_in])
-        avg_gaze_ratio = (gaze_ratio_l + gaze_ratio_r) / 2.0
         
-        # Determine Direction
-        # Range is 0.0 (Left-most) to 1.0 (Right-most). Center is ~0.5.
-        # NARROWER THRESHOLDS for better sensitivity at distance
-        new_gaze = "Center"
-        if avg_gaze_ratio < 0.46:  
-            new_gaze = "Right" # Mirrored: User looking to their Right (Screen Left)
-        elif avg_gaze_ratio > 0.54:
-            new_gaze = "Left" # Mirrored: User looking to their Left (Screen Right)
+        # Determine Direction: branchless bucket lookup (see GAZE_BOUNDS/GAZE_LABELS)
+        low, high = self.GAZE_BOUNDS
+        new_gaze = self.GAZE_LABELS[int(avg_gaze_ratio >= low) + int(avg_gaze_ratio > high)]
             
-        results_dict['gaze_direction'] = new_gaze
+        state.gaze_direction = new_gaze
         
         # Log Gaze Alerts
         if new_gaze != self.gaze_direction:
@@ -144,7 +367,7 @@ class UnifiedFaceDetector:
             self.gaze_direction = new_gaze
             self.last_gaze_change = current_time
             
-        if self.gaze_changes > 5 and (current_time - self.last_gaze_change).total_seconds() < 2:
+        if self.gaze_changes > 5 and (current_time - self.last_gaze_change) < 2:
              if self.alert_logger:
                 self.alert_logger.log_alert("GAZE_MOVEMENT", "Rapid gaze shifting detected")
              self.gaze_changes = 0
@@ -157,44 +380,34 @@ class UnifiedFaceDetector:
         # Left: 61, Right: 291
         # Inner lips for better "open" detection
         
-        mouth_top = (landmarks[13].x * w, landmarks[13].y * h)
-        mouth_bottom = (landmarks[14].x * w, landmarks[14].y * h)
-        mouth_left = (landmarks[61].x * w, landmarks[61].y * h)
-        mouth_right = (landmarks[291].x * w, landmarks[291].y * h)
-        
-        # Vertical / Horizontal
-        mouth_height = np.linalg.norm(np.array(mouth_top) - np.array(mouth_bottom))
-        mouth_width = np.linalg.norm(np.array(mouth_left) - np.array(mouth_right))
-        
-        if mouth_width == 0: mouth_width = 1
-        mar = mouth_height / mouth_width
-        results_dict['mouth_open_score'] = mar
+        # Vertical / Horizontal (pixels), computed in _compute_metrics
+        state.mouth_open_score = float(mar)
         
         is_mouth_open = mar > self.MAR_THRESHOLD
         
         # Simple temporal smoothing for mouth moving (talking)
-        self.mouth_state_history.append(1 if is_mouth_open else 0)
-        if len(self.mouth_state_history) > self.MOUTH_HISTORY_LEN:
-            self.mouth_state_history.pop(0)
+        bit = int(is_mouth_open)
+        if len(self.mouth_state_history) == self.MOUTH_HISTORY_LEN:
+            self._mouth_activity -= self.mouth_state_history[0]  # about to be evicted
+        self.mouth_state_history.append(bit)
+        self._mouth_activity += bit
             
         # If mouth has been open and closed frequently, it's talking
-        activity = sum(self.mouth_state_history)
+        activity = self._mouth_activity
         # Lower activity requirement: even 2 frames of "open" in the history window triggers alert
         if activity >= 2: 
-             results_dict['mouth_moving'] = True
+             state.mouth_moving = True
              if self.alert_logger and activity == 2: # Log once when starting
                  self.alert_logger.log_alert("MOUTH_MOVING", "Talking detected (Mouth Aspect Ratio)")
         else:
-             results_dict['mouth_moving'] = False
+             state.mouth_moving = False
              
         # ---------------------------------------------------------
         # 3. Eye Aspect Ratio (EAR) for Drowsiness/Blink
         # ---------------------------------------------------------
         # Simple proxy: distance between upper and lower lid
         # Left Eye Lids: 159 (top), 145 (bottom)
-        l_top = np.array([landmarks[159].x, landmarks[159].y])
-        l_bot = np.array([landmarks[145].x, landmarks[145].y])
-        ear = np.linalg.norm(l_top - l_bot) * 10 # Scale up
-        results_dict['eye_ratio'] = ear
+        # Computed in _compute_metrics (already scaled up x10)
+        state.eye_ratio = float(ear)
 
-        return results_dict
+        return state
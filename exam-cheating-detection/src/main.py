@@ -1,7 +1,15 @@
+import os
+# Cap OpenMP/BLAS pools before cv2/torch load so MediaPipe's threads aren't oversubscribed
+os.environ.setdefault('OMP_NUM_THREADS', '2')
 import cv2
 import yaml
-import os
+import json
+import queue
+import sys
+import threading
+import time
 from datetime import datetime
+from functools import lru_cache
 from detection.object_detection import ObjectDetector
 from detection.multi_face import MultiFaceDetector
 from detection.unified_detector import UnifiedFaceDetector  # [NEW] Robust MediaPipe Detector
@@ -14,29 +22,123 @@ from utils.screenshot_utils import ViolationCapturer
 from reporting.report_generator import ReportGenerator
 
 
-def load_config():
-    with open('config/config.yaml') as f:
-        return yaml.safe_load(f)
+def load_config(path='config/config.yaml'):
+    """Load the YAML config, reusing a JSON copy while the YAML's mtime and size are unchanged"""
+    cache_path = os.path.splitext(path)[0] + '.json.cache'
+    stat = os.stat(path)
+    source = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+            if isinstance(cached, dict) and cached.get('source') == source:
+                return cached['config']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # Corrupt cache: fall through and re-parse
+            
+    # libyaml's C loader when available (much faster than the pure-Python one)
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(path) as f:
+        config = yaml.load(f, Loader=loader)
+        
+    try:
+        with open(cache_path, 'w') as f:
+            json.dump({'source': source, 'config': config}, f)
+    except (OSError, TypeError):
+        pass  # Read-only install or non-JSON values: just parse the YAML next time too
+    return config
+
+def open_camera(config):
+    """Open the webcam with the native backend and MJPG so the camera sends compressed
+    frames (less USB bandwidth, no driver-side YUY2->BGR conversion)"""
+    source = config['video']['source']
+    if not isinstance(source, int):
+        # Video file / stream URL: let OpenCV pick the backend
+        return cv2.VideoCapture(source)
+        
+    if sys.platform.startswith('win'):
+        backend = cv2.CAP_DSHOW
+    elif sys.platform == 'darwin':
+        backend = cv2.CAP_AVFOUNDATION
+    else:
+        backend = cv2.CAP_V4L2
+    cap = cv2.VideoCapture(source, backend)
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(source)
+        
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, config['video']['resolution'][0])
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config['video']['resolution'][1])
+    # Match the recorder's fps so recordings play back at real speed
+    cap.set(cv2.CAP_PROP_FPS, config['video']['fps'])
+    # Keep only the newest frame to avoid stale-frame latency
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+def put_until_stopped(q, item, stop_event):
+    """Put item on a bounded queue, giving up once stop_event is set"""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def put_latest(q, item):
+    """Put item on a bounded queue, dropping the oldest entry if it is full (single producer)"""
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            pass
+        q.put_nowait(item)
+
+def capture_frames(cap, frame_queue, stop_event):
+    """Capture stage: read webcam frames into frame_queue, None when the stream ends.
+    When the main loop falls behind the oldest queued frame is dropped, so it always gets a fresh one"""
+    try:
+        while not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            put_latest(frame_queue, frame)
+    finally:
+        # Always unblock the main loop, even if cap.read() raised
+        put_until_stopped(frame_queue, None, stop_event)
+
+@lru_cache(maxsize=1)
+def format_display_time(seconds):
+    """Overlay clock text; only re-formatted when the second changes"""
+    return datetime.fromtimestamp(seconds).strftime("%Y-%m-%d %H:%M:%S")
+
+def frame_log_entry(results):
+    """Snapshot of the frame state for violations.json, with the readable timestamp"""
+    entry = results.to_dict()
+    entry['timestamp'] = format_display_time(int(results.timestamp))
+    return entry
+
+# Overlay strings are built once; indexed by the boolean state (False, True)
+FACE_LABELS = ("Face: Absent", "Face: Present")
+EYES_LABELS = ("Eyes: Closed", "Eyes: Open")
+MOUTH_LABELS = ("Mouth: Still", "Mouth: Moving")
+GAZE_LABELS = {direction: f"Gaze: {direction}" for direction in ("Center", "Left", "Right", "Unknown")}
 
 def display_detection_results(frame, results):
     y_offset = 30
     line_height = 30
     
     # Status indicators
-    status_items = [
-        f"Face: {'Present' if results['face_present'] else 'Absent'}",
-        f"Gaze: {results['gaze_direction']}",
-        f"Eyes: {'Open' if results['eye_ratio'] > 0.15 else 'Closed'}", # Adjusted for distance (was 0.05)
-        f"Mouth: {'Moving' if results['mouth_moving'] else 'Still'}"
-    ]
+    gaze = results.gaze_direction
+    status_items = (
+        FACE_LABELS[bool(results.face_present)],
+        GAZE_LABELS.get(gaze) or f"Gaze: {gaze}",
+        EYES_LABELS[results.eye_ratio > 0.15], # Adjusted for distance (was 0.05)
+        MOUTH_LABELS[bool(results.mouth_moving)]
+    )
     
-    # Alert indicators
-    alert_items = []
-    if results['multiple_faces']:
-        alert_items.append("Multiple Faces Detected!")
-    if results['objects_detected']:
-        alert_items.append("Suspicious Object Detected!")
-
     # Display status
     for item in status_items:
         cv2.putText(frame, item, (10, y_offset), 
@@ -44,13 +146,17 @@ def display_detection_results(frame, results):
         y_offset += line_height
     
     # Display alerts
-    for item in alert_items:
-        cv2.putText(frame, item, (10, y_offset), 
+    if results.multiple_faces:
+        cv2.putText(frame, "Multiple Faces Detected!", (10, y_offset), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+        y_offset += line_height
+    if results.objects_detected:
+        cv2.putText(frame, "Suspicious Object Detected!", (10, y_offset), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         y_offset += line_height
     
     # Timestamp
-    cv2.putText(frame, results['timestamp'], 
+    cv2.putText(frame, format_display_time(int(results.timestamp)), 
                (frame.shape[1] - 250, 30), 
                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
 
@@ -95,6 +201,11 @@ def main():
         audio_monitor.start()
 
     cap = None  # Initialize to None so it can be safely accessed in finally block
+    # Pipeline: capture thread -> detection/display (main thread) -> recorder's writer thread.
+    # cap.read, MediaPipe/YOLO inference and VideoWriter.write all release the GIL.
+    stop_event = threading.Event()
+    frame_queue = queue.Queue(maxsize=2)
+    capture_thread = None
     try:
         if config['screen']['recording']:
             print("[DEBUG] Starting screen recording...")
@@ -109,6 +220,7 @@ def main():
         
         print("[DEBUG] Initializing Other Detectors...")
         # Keep specialized detectors
+        # MultiFaceDetector reuses the unified detector's face count (no extra inference)
         multi_face_detector = MultiFaceDetector(config)
         object_detector = ObjectDetector(config)
         object_detector.set_alert_logger(alert_logger)
@@ -116,76 +228,58 @@ def main():
         print("[DEBUG] Starting Webcam...")
         # Start webcam recording
         video_recorder.start_recording()
-        cap = cv2.VideoCapture(config['video']['source'])
+        cap = open_camera(config)
         print(f"[DEBUG] Camera Opened: {cap.isOpened()}")
         
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, config['video']['resolution'][0])
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config['video']['resolution'][1])
+        capture_thread = threading.Thread(target=capture_frames, args=(cap, frame_queue, stop_event), daemon=True)
+        capture_thread.start()
         
         print("[DEBUG] Entering Main Loop...")
         while True:
-            ret, frame = cap.read()
-            if not ret:
+            frame = frame_queue.get()
+            if frame is None:
                 break
                 
-            results = {
-                'face_present': False,
-                'gaze_direction': 'Center',
-                'eye_ratio': 0.3,
-                'mouth_moving': False,
-                'multiple_faces': False,
-                'objects_detected': False,
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            
             # [NEW] Unified Detection Pass
-            unified_results = unified_detector.process_frame(frame)
-            results.update(unified_results)
+            # Returns the detector's reused DetectionState; the other fields are filled in below
+            results = unified_detector.process_frame(frame)
+            results.timestamp = time.time()  # epoch seconds, formatted only when shown/logged
             
             # [OLD] Legacy Detection Passes
-            results['multiple_faces'] = multi_face_detector.detect_multiple_faces(frame)
-            results['objects_detected'] = object_detector.detect_objects(frame, visualize=True)
+            results.multiple_faces = multi_face_detector.detect_multiple_faces(
+                results.face_count, results.fresh)
+            # Hits are (frame, timestamp) of batched frames whose own detections were positive
+            object_hits = object_detector.detect_objects(
+                frame, visualize=True, face_bbox=results.face_bbox, timestamp=results.timestamp)
+            results.objects_detected = object_detector.last_detected
 
-            if not results['face_present']:
+            if not results.face_present:
                 violation_type = "FACE_DISAPPEARED"
                 alert_system.speak_alert(violation_type)
                 
                 # Capture and log violation
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                timestamp = datetime.fromtimestamp(results.timestamp).strftime("%Y%m%d_%H%M%S_%f")
                 violation_image = violation_capturer.capture_violation(frame, violation_type, timestamp)
                 violation_logger.log_violation(
                     violation_type,
                     timestamp,
-                    {'duration': '5+ seconds', 'frame': results}
+                    {'duration': '5+ seconds', 'frame': frame_log_entry(results)}
                 )
                 # alert_system.speak_alert("FACE_DISAPPEARED")
-            elif results['multiple_faces']:
+            elif results.multiple_faces:
                 violation_type = "MULTIPLE_FACES"
                 alert_system.speak_alert(violation_type)
                 
                 # Capture and log violation
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                timestamp = datetime.fromtimestamp(results.timestamp).strftime("%Y%m%d_%H%M%S_%f")
                 violation_image = violation_capturer.capture_violation(frame, violation_type, timestamp)
                 violation_logger.log_violation(
                     violation_type,
                     timestamp,
-                    {'duration': '5+ seconds', 'frame': results}
+                    {'duration': '5+ seconds', 'frame': frame_log_entry(results)}
                 )
                 # alert_system.speak_alert("MULTIPLE_FACES")
-            elif results['objects_detected']:
-                violation_type = "OBJECT_DETECTED"
-                alert_system.speak_alert(violation_type)
-                
-                # Capture and log violation
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-                violation_image = violation_capturer.capture_violation(frame, violation_type, timestamp)
-                violation_logger.log_violation(
-                    violation_type,
-                    timestamp,
-                    {'duration': '5+ seconds', 'frame': results}
-                )
-                # alert_system.speak_alert("OBJECT_DETECTED")
-            # elif results['gaze_direction'] != "Center":
+            # elif results.gaze_direction != "Center":
             #     violation_type = "GAZE_AWAY"
             #     alert_system.speak_alert(violation_type)
                 
@@ -195,25 +289,43 @@ def main():
             #     violation_logger.log_violation(
             #         violation_type,
             #         timestamp,
-            #         {'duration': '5+ seconds', 'frame': results}
+            #         {'duration': '5+ seconds', 'frame': frame_log_entry(results)}
             #     )
                 # alert_system.speak_alert("GAZE_AWAY")
-            elif results['mouth_moving']:
+            elif results.mouth_moving:
                 violation_type = "MOUTH_MOVING"
                 alert_system.speak_alert(violation_type)
                 
                 # Capture and log violation
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                timestamp = datetime.fromtimestamp(results.timestamp).strftime("%Y%m%d_%H%M%S_%f")
                 violation_image = violation_capturer.capture_violation(frame, violation_type, timestamp)
                 violation_logger.log_violation(
                     violation_type,
                     timestamp,
-                    {'duration': '5+ seconds', 'frame': results}
+                    {'duration': '5+ seconds', 'frame': frame_log_entry(results)}
                 )
                 # alert_system.speak_alert("MOUTH_MOVING")
 
+            # Object hits may belong to earlier frames of the batch; log each against its own frame
+            if object_hits:
+                violation_type = "OBJECT_DETECTED"
+                alert_system.speak_alert(violation_type)
+                
+                for hit_frame, hit_time in object_hits:
+                    # Capture and log violation
+                    timestamp = datetime.fromtimestamp(hit_time).strftime("%Y%m%d_%H%M%S_%f")
+                    violation_image = violation_capturer.capture_violation(hit_frame, violation_type, timestamp)
+                    frame_entry = frame_log_entry(results)
+                    frame_entry['timestamp'] = format_display_time(int(hit_time))
+                    frame_entry['objects_detected'] = True
+                    violation_logger.log_violation(
+                        violation_type,
+                        timestamp,
+                        {'duration': '5+ seconds', 'frame': frame_entry}
+                    )
             
-            # Display and record
+            # Display and record; boxes go on after evidence capture so they never leak into screenshots
+            object_detector.draw_last_detections(frame)
             display_detection_results(frame, results)
             video_recorder.record_frame(frame)
             
@@ -223,6 +335,12 @@ def main():
                 break
                 
     finally:
+        # Stop capture first; recorders drain their write queues when stopped
+        stop_event.set()
+        if capture_thread:
+            capture_thread.join()
+        violation_capturer.close()
+            
         violations = violation_logger.get_violations()
         report_path = report_generator.generate_report(student_info, violations)
         if report_path:
@@ -6,6 +6,7 @@ from detection.eye_tracking import EyeTracker
 from detection.mouth_detection import MouthMonitor
 from detection.object_detection import ObjectDetector
 from detection.multi_face import MultiFaceDetector
+from detection.unified_detector import UnifiedFaceDetector
 from utils.video_utils import VideoRecorder
 from utils.screen_capture import ScreenRecorder
 from utils.logging import AlertLogger
@@ -44,6 +45,7 @@ def main():
         MouthMonitor(config),
         MultiFaceDetector(config),
         ObjectDetector(config),
+        UnifiedFaceDetector(config),  # supplies face_count to MultiFaceDetector
     ]
     print("✓ Detectors initialized")
     
@@ -89,7 +91,8 @@ def main():
             traceback.print_exc()
         
         try:
-            multiple_faces = detectors[3].detect_multiple_faces(frame)
+            results = detectors[5].process_frame(frame)
+            multiple_faces = detectors[3].detect_multiple_faces(results.face_count, results.fresh)
             print(f"✓ Multi-face detection: {multiple_faces}")
         except Exception as e:
             print(f"✗ Multi-face detection error: {e}")
@@ -97,7 +100,7 @@ def main():
             traceback.print_exc()
         
         try:
-            objects_detected = detectors[4].detect_objects(frame)
+            objects_detected = detectors[4].detect_objects_batch([frame])[0]
             print(f"✓ Object detection: {objects_detected}")
         except Exception as e:
             print(f"✗ Object detection error: {e}")
@@ -1,5 +1,7 @@
 import cv2
 import os
+import queue
+import threading
 from datetime import datetime
 
 class ViolationCapturer:
@@ -7,8 +9,22 @@ class ViolationCapturer:
         self.output_dir = os.path.join(config['global']['output_path'], "violation_captures")
         os.makedirs(self.output_dir, exist_ok=True)
         
+        # JPEG encoding and disk writes happen on a background thread
+        self.save_queue = queue.Queue(maxsize=4)
+        self.thread = threading.Thread(target=self._save_loop, daemon=True)
+        self.thread.start()
+        
+    def _save_loop(self):
+        """Writer loop running in separate thread; stops at the None sentinel"""
+        while True:
+            item = self.save_queue.get()
+            if item is None:
+                break
+            path, image = item
+            cv2.imwrite(path, image)
+        
     def capture_violation(self, frame, violation_type, timestamp=None):
-        """Saves violation screenshot with metadata"""
+        """Saves violation screenshot with metadata (written asynchronously)"""
         timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         filename = f"{violation_type}_{timestamp}.jpg"
         path = os.path.join(self.output_dir, filename)
@@ -18,9 +34,16 @@ class ViolationCapturer:
         cv2.putText(labeled_frame, f"{violation_type} - {timestamp}", (20, 40), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         
-        cv2.imwrite(path, labeled_frame)
+        self.save_queue.put((path, labeled_frame))
         return {
             'type': violation_type,
             'timestamp': timestamp,
             'image_path': os.path.abspath(path)
-        }
\ No newline at end of file
+        }
+        
+    def close(self):
+        """Wait for pending screenshots to be written"""
+        if self.thread:
+            self.save_queue.put(None)
+            self.thread.join()
+            self.thread = None
\ No newline at end of file
@@ -32,6 +32,8 @@
 
 import cv2
 import os
+import queue
+import threading
 from datetime import datetime
 
 class VideoRecorder:
@@ -44,6 +46,9 @@ class VideoRecorder:
         self.filename = None
         self.frame_count = 0
         self.start_time = datetime.now()
+        # Frames are encoded/written on a background thread
+        self.frame_queue = queue.Queue(maxsize=4)
+        self.thread = None
         
     def start_recording(self):
         if not os.path.exists(self.recording_path):
@@ -59,13 +64,31 @@ class VideoRecorder:
             self.resolution
         )
         
-    def record_frame(self, frame):
-        if self.writer:
+        # Start writer thread
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+        
+    def _write_loop(self):
+        """Writer loop running in separate thread; stops at the None sentinel"""
+        while True:
+            frame = self.frame_queue.get()
+            if frame is None:
+                break
             self.writer.write(frame)
             self.frame_count += 1
+        
+    def record_frame(self, frame):
+        """Queue a frame for writing. The frame is not copied, so the caller must
+        not modify it afterwards (cap.read() returns a new array each time)"""
+        if self.writer:
+            self.frame_queue.put(frame)
             
     def stop_recording(self):
         if self.writer:
+            # Drain pending frames before closing the file
+            self.frame_queue.put(None)
+            self.thread.join()
+            self.thread = None
             self.writer.release()
             self.writer = None
             duration = (datetime.now() - self.start_time).total_seconds()